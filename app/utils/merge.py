@@ -1,11 +1,16 @@
 from __future__ import annotations
 
 import csv
-import re
-from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+import io
+import sys
+from datetime import date, datetime, time
+from functools import lru_cache
+from types import MappingProxyType
+from typing import Any, BinaryIO, Dict, Iterable, Iterator, List, Mapping, Optional, Sequence, Tuple, Union
 
 from dateutil import parser as dateparser
 from openpyxl import load_workbook
+from python_calamine import CalamineError, CalamineWorkbook
 
 
 NORMALIZED_COLUMN_ALIASES: Dict[str, List[str]] = {
@@ -41,112 +46,251 @@ NORMALIZED_COLUMN_ALIASES: Dict[str, List[str]] = {
 }
 
 
+class _CanonTable(dict):
+    # Anything outside the ASCII table is treated as a separator.
+    def __missing__(self, key: int) -> str:
+        return " "
+
+
+# ASCII letters/digits map to their lowercase form, everything else to a space.
+_CANON_TABLE = _CanonTable(
+    {i: (chr(i).lower() if chr(i).isalnum() else " ") for i in range(128)}
+)
+
+
 def _canonicalize(name: str) -> str:
-    s = name.strip().lower()
-    s = re.sub(r"[^a-z0-9]+", " ", s)
-    s = re.sub(r"\s+", " ", s).strip()
-    return s
+    if not name.isascii():
+        # Lowercase first so non-ASCII case folds that land in ASCII are kept.
+        name = name.lower()
+    return " ".join(name.translate(_CANON_TABLE).split())
+
+
+def _build_alias_index() -> Mapping[str, str]:
+    index: Dict[str, str] = {}
+    for canonical, aliases in NORMALIZED_COLUMN_ALIASES.items():
+        canonical = sys.intern(canonical)
+        for alias in [canonical, *aliases]:
+            # First canonical listed wins, as with the old linear scan
+            index.setdefault(sys.intern(_canonicalize(alias)), canonical)
+    # Read-only view so the shared index cannot be mutated across threads
+    return MappingProxyType(index)
+
 
+_ALIAS_TO_CANONICAL: Mapping[str, str] = _build_alias_index()
 
+
+@lru_cache(maxsize=4096)
 def _map_column(name: str) -> str:
     c_norm = _canonicalize(str(name))
-    for canonical, aliases in NORMALIZED_COLUMN_ALIASES.items():
-        if c_norm == canonical or c_norm in aliases:
-            return canonical
-    return c_norm
+    return _ALIAS_TO_CANONICAL.get(c_norm, c_norm)
+
+
+def _iter_openpyxl_rows(source: Union[str, BinaryIO]) -> Iterator[Sequence[Any]]:
+    wb = load_workbook(source, read_only=True, data_only=True)
+    try:
+        # First sheet, matching the calamine path, not whichever sheet was active
+        yield from wb.worksheets[0].iter_rows(values_only=True)
+    finally:
+        wb.close()
+
+
+def _from_calamine(v: Any) -> Any:
+    # Bring calamine's cell types in line with openpyxl's so a frame does not
+    # depend on which reader handled the file
+    if isinstance(v, float):
+        # calamine reports every number as float; whole numbers come back
+        # as int like openpyxl so key values such as "1" still match
+        return int(v) if v.is_integer() else v
+    if isinstance(v, date) and not isinstance(v, datetime):
+        # Midnight date cells come back as date; openpyxl gives datetime
+        return datetime.combine(v, time())
+    return v
 
 
-def read_table(path: str) -> List[Dict[str, Any]]:
-    if path.lower().endswith((".xlsx", ".xls")):
-        wb = load_workbook(path, read_only=True, data_only=True)
-        ws = wb.active
-        rows_iter = ws.iter_rows(values_only=True)
+def _iter_sheet_rows(source: Union[str, BinaryIO]) -> Iterator[Sequence[Any]]:
+    # calamine parses in native code and is much faster than openpyxl; openpyxl
+    # stays as the fallback for workbooks calamine cannot open
+    try:
+        wb = CalamineWorkbook.from_object(source)
+        sheet = wb.get_sheet_by_index(0)
+    except CalamineError:
+        if not isinstance(source, str):
+            source.seek(0)
+        yield from _iter_openpyxl_rows(source)
+        return
+    try:
+        for row in sheet.iter_rows():
+            yield [_from_calamine(v) for v in row]
+    finally:
+        wb.close()
+
+
+def read_table(source: Union[str, BinaryIO], filename: Optional[str] = None) -> Iterator[Dict[str, Any]]:
+    # ``source`` is a path or a binary file object (e.g. an upload stream); for
+    # file objects ``filename`` supplies the extension.
+    # Rows are yielded lazily so callers never hold a second full copy of the file
+    name = filename if filename is not None else str(source)
+    if name.lower().endswith((".xlsx", ".xls")):
+        rows_iter = _iter_sheet_rows(source)
         try:
             headers = next(rows_iter)
         except StopIteration:
-            return []
-        headers = [str(h) if h is not None else "" for h in headers]
-        records: List[Dict[str, Any]] = []
+            return
+        width = len(headers)
+        # Columns without a header are dropped
+        keep_idx = [i for i, h in enumerate(headers) if h is not None and str(h) != ""]
+        header_names = [str(headers[i]) for i in keep_idx]
         for row in rows_iter:
-            rec = {}
-            for h, v in zip(headers, row):
-                if h == "":
-                    continue
-                rec[h] = v
-            # skip entirely empty rows
-            if any(v is not None and str(v).strip() != "" for v in rec.values()):
-                records.append(rec)
-        return records
+            if len(row) < width:
+                row = tuple(row) + (None,) * (width - len(row))
+            values = [row[i] for i in keep_idx]
+            # skip entirely empty rows, without coercing numbers to str
+            if any(v is not None and (not isinstance(v, str) or v.strip()) for v in values):
+                yield dict(zip(header_names, values))
     else:
         # CSV
-        with open(path, newline="", encoding="utf-8") as f:
-            reader = csv.DictReader(f)
-            return [dict(row) for row in reader]
-
-
-def normalize_records(records: List[Dict[str, Any]]) -> tuple[List[Dict[str, Any]], Dict[str, str]]:
-    # Build column map from first record keys (and extend as new keys appear)
-    col_map: Dict[str, str] = {}
-    normalized: List[Dict[str, Any]] = []
-    for rec in records:
-        out: Dict[str, Any] = {}
-        for k, v in rec.items():
-            if k not in col_map:
-                col_map[k] = _map_column(k)
-            out[col_map[k]] = v
-        normalized.append(out)
-    return normalized, col_map
-
-
-def infer_key_columns(frames: Iterable[List[Dict[str, Any]]], key_options: List[List[str]]) -> Optional[List[str]]:
-    frames_list = list(frames)
+        if isinstance(source, str):
+            f = open(source, newline="", encoding="utf-8")
+        else:
+            f = io.TextIOWrapper(source, encoding="utf-8", newline="")
+        with f:
+            yield from csv.DictReader(f)
+
+
+class _ColumnMap(dict):
+    # Maps raw headers to canonical names, resolving unseen headers on first use
+    def __missing__(self, key: str) -> str:
+        value = self[key] = _map_column(key)
+        return value
+
+
+def normalize_records(records: Iterable[Dict[str, Any]]) -> tuple[List[Dict[str, Any]], Dict[str, str]]:
+    # Single pass so ``records`` may be a lazy reader such as read_table().
+    # String values are stripped and blank ones become None, so downstream
+    # code sees None (never "") for empty cells.
+    col_map = _ColumnMap()
+    normalized: List[Dict[str, Any]] = [
+        {col_map[k]: (v.strip() or None) if isinstance(v, str) else v for k, v in rec.items()}
+        for rec in records
+    ]
+    return normalized, dict(col_map)
+
+
+def read_and_normalize(data: bytes, filename: str) -> tuple[List[Dict[str, Any]], Dict[str, str]]:
+    # Module-level so it can be submitted to a process pool with an upload's bytes
+    return normalize_records(read_table(io.BytesIO(data), filename))
+
+
+def infer_key_columns(
+    frames: Iterable[List[Dict[str, Any]]],
+    key_options: List[List[str]],
+    frame_columns: Optional[Sequence[Iterable[str]]] = None,
+) -> Optional[List[str]]:
+    # frame_columns, when given, lists each frame's columns so records need not be rescanned
+    if frame_columns is None:
+        frame_cols = [set().union(*(rec.keys() for rec in frame)) for frame in frames]
+    else:
+        frame_cols = [set(cols) for cols in frame_columns]
     for keys in key_options:
-        ok = True
-        for frame in frames_list:
-            cols = set()
-            for rec in frame:
-                cols.update(rec.keys())
-            if not all(k in cols for k in keys):
-                ok = False
-                break
-        if ok:
+        if all(c.issuperset(keys) for c in frame_cols):
             return keys
     return None
 
 
 def _compose_key(rec: Dict[str, Any], keys: Sequence[str]) -> Optional[Tuple[str, ...]]:
+    if len(keys) == 1:
+        # Common case (organisation_id): no intermediate list
+        v = rec.get(keys[0])
+        if v is None:
+            return None
+        s = v.strip() if isinstance(v, str) else str(v).strip()
+        return (s,) if s else None
     values: List[str] = []
     for k in keys:
         v = rec.get(k)
         if v is None:
             return None
-        s = str(v).strip()
+        s = v.strip() if isinstance(v, str) else str(v).strip()
         if s == "":
             return None
         values.append(s)
     return tuple(values)
 
 
-def combine_records(frames: Iterable[List[Dict[str, Any]]], keys: List[str]) -> List[Dict[str, Any]]:
-    frames_list = list(frames)
-    combined_map: Dict[Tuple[str, ...], Dict[str, Any]] = {}
-    for frame in frames_list:
+def combine_columns(frames: Iterable[List[Dict[str, Any]]], keys: List[str]) -> Dict[str, List[Any]]:
+    # Column store: column name -> list of values, where position i in every
+    # list belongs to the same combined row (rows ordered by first key seen).
+    # Callers that can work on columns avoid building a dict per combined row.
+    index: Dict[Tuple[str, ...], int] = {}
+    columns: Dict[str, List[Any]] = {key_name: [] for key_name in keys}
+    for frame in frames:
         for rec in frame:
             k = _compose_key(rec, keys)
             if k is None:
                 # Skip rows that lack join keys
                 continue
-            target = combined_map.setdefault(k, {})
-            # Ensure key fields are present
-            for i, key_name in enumerate(keys):
-                target.setdefault(key_name, k[i])
-            # Merge preferring existing non-empty, else new value
+            i = index.get(k)
+            if i is None:
+                i = index[k] = len(index)
+            # Merge preferring existing non-empty, else new value;
+            # normalize_records has already turned blank strings into None
             for col, val in rec.items():
-                if val is None or str(val).strip() == "":
+                if val is None:
                     continue
-                if col not in target or target[col] is None or str(target[col]).strip() == "":
-                    target[col] = val
-    return list(combined_map.values())
+                column = columns.get(col)
+                if column is None:
+                    column = columns[col] = []
+                # Columns only grow as far as the last row that had a value
+                size = len(column)
+                if size <= i:
+                    if size < i:
+                        column.extend([None] * (i - size))
+                    column.append(val)
+                elif column[i] is None:
+                    column[i] = val
+
+    n = len(index)
+    for column in columns.values():
+        if len(column) < n:
+            column.extend([None] * (n - len(column)))
+    # Key fields hold the stripped key values, as the join saw them
+    for pos, key_name in enumerate(keys):
+        columns[key_name] = [k[pos] for k in index]
+    return columns
+
+
+def column_rows(columns: Dict[str, List[Any]]) -> int:
+    return len(next(iter(columns.values()), ()))
+
+
+def columns_to_records(columns: Dict[str, List[Any]]) -> List[Dict[str, Any]]:
+    names = list(columns)
+    return [dict(zip(names, row)) for row in zip(*columns.values())]
+
+
+def combine_records(frames: Iterable[List[Dict[str, Any]]], keys: List[str]) -> List[Dict[str, Any]]:
+    # Row view of combine_columns, for callers that need one dict per row
+    return columns_to_records(combine_columns(frames, keys))
+
+
+@lru_cache(maxsize=65536)
+def _parse_date_on(s: str, today: date) -> Optional[str]:
+    # dateutil fills missing parts from today's date, so the day is part of the
+    # cache key and partial dates stay correct across midnight
+    try:
+        dt = dateparser.parse(s, dayfirst=False)
+        return dt.date().isoformat()
+    except Exception:
+        return None
+
+
+def _parse_date_str(s: str) -> Optional[str]:
+    # Cheap path for ISO dates before falling back to dateutil's format probing
+    try:
+        return datetime.fromisoformat(s).date().isoformat()
+    except ValueError:
+        pass
+    return _parse_date_on(s, date.today())
 
 
 def parse_date(value: Any) -> Optional[str]:
@@ -154,15 +298,8 @@ def parse_date(value: Any) -> Optional[str]:
         return None
     if isinstance(value, (int, float)):
         # likely Excel serial is not handled here; leave as None
-        try:
-            return dateparser.parse(str(value)).date().isoformat()
-        except Exception:
-            return None
+        return _parse_date_str(str(value))
     s = str(value).strip()
     if not s:
         return None
-    try:
-        dt = dateparser.parse(s, dayfirst=False)
-        return dt.date().isoformat()
-    except Exception:
-        return None
+    return _parse_date_str(s)
@@ -0,0 +1,33 @@
+from __future__ import annotations
+
+from typing import Tuple
+
+import numpy as np
+from numba import njit
+
+
+# Serial on purpose: the loop is memory-bound, and Numba's fallback workqueue
+# threading layer aborts the process when several request threads enter a
+# parallel region at once
+@njit(cache=True)
+def _nan_stats(values: np.ndarray) -> Tuple[float, float, float, int]:
+    total = 0.0
+    lo = np.inf
+    hi = -np.inf
+    count = 0
+    for i in range(values.size):
+        v = values[i]
+        if not np.isnan(v):
+            total += v
+            count += 1
+            lo = min(lo, v)
+            hi = max(hi, v)
+    return total, lo, hi, count
+
+
+def float_stats(values: np.ndarray) -> dict:
+    # avg/min/max over the non-NaN entries; all zero when there are none
+    total, lo, hi, count = _nan_stats(np.ascontiguousarray(values, dtype=np.float64))
+    if count == 0:
+        return {"avg": 0.0, "min": 0.0, "max": 0.0}
+    return {"avg": float(total / count), "min": float(lo), "max": float(hi)}
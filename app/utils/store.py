@@ -0,0 +1,148 @@
+from __future__ import annotations
+
+import logging
+import os
+import threading
+from collections import OrderedDict
+from datetime import date, datetime, time, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+import msgpack
+
+logger = logging.getLogger(__name__)
+
+# msgpack extension type codes for cell values it cannot encode natively
+_EXT_DATETIME = 1
+_EXT_DATE = 2
+_EXT_TIME = 3
+_EXT_TIMEDELTA = 4
+_EXT_BIGINT = 5
+
+
+def _encode(obj: Any) -> Any:
+    # datetime must be checked before its base class date
+    if isinstance(obj, datetime):
+        return msgpack.ExtType(_EXT_DATETIME, obj.isoformat().encode())
+    if isinstance(obj, date):
+        return msgpack.ExtType(_EXT_DATE, obj.isoformat().encode())
+    if isinstance(obj, time):
+        return msgpack.ExtType(_EXT_TIME, obj.isoformat().encode())
+    if isinstance(obj, timedelta):
+        return msgpack.ExtType(
+            _EXT_TIMEDELTA, msgpack.packb([obj.days, obj.seconds, obj.microseconds])
+        )
+    if isinstance(obj, int):
+        # Only ints outside msgpack's 64-bit range reach here
+        return msgpack.ExtType(_EXT_BIGINT, str(obj).encode())
+    # Anything else is kept as its text, which is what the exports would show
+    return str(obj)
+
+
+def _decode(code: int, data: bytes) -> Any:
+    if code == _EXT_DATETIME:
+        return datetime.fromisoformat(data.decode())
+    if code == _EXT_DATE:
+        return date.fromisoformat(data.decode())
+    if code == _EXT_TIME:
+        return time.fromisoformat(data.decode())
+    if code == _EXT_TIMEDELTA:
+        days, seconds, microseconds = msgpack.unpackb(data)
+        return timedelta(days=days, seconds=seconds, microseconds=microseconds)
+    if code == _EXT_BIGINT:
+        return int(data.decode())
+    return msgpack.ExtType(code, data)
+
+
+class SessionStore:
+    # Per-session data kept in RAM for the most recently used sessions only.
+    # Older entries are written to ``spill_dir`` as msgpack and reloaded on next access.
+
+    def __init__(self, spill_dir: str, maxsize: int = 64) -> None:
+        self.spill_dir = spill_dir
+        self.maxsize = maxsize
+        self._entries: "OrderedDict[str, dict]" = OrderedDict()
+        self._in_use: Dict[str, int] = {}
+        # Entries popped for eviction whose spill file is still being written
+        self._spilling: Dict[str, dict] = {}
+        self._cond = threading.Condition()
+
+    def _spill_path(self, sid: str) -> str:
+        return os.path.join(self.spill_dir, f"{sid}.msgpack")
+
+    def _spill(self, sid: str, entry: dict) -> None:
+        path = self._spill_path(sid)
+        tmp_path = path + ".tmp"
+        try:
+            os.makedirs(self.spill_dir, exist_ok=True)
+            with open(tmp_path, "wb") as f:
+                msgpack.pack(entry, f, default=_encode, use_bin_type=True)
+            os.replace(tmp_path, path)
+        except OSError:
+            # Nowhere to spill to; the entry is dropped as on a restart
+            logger.exception("Could not spill session %s to %s; its data is dropped", sid, path)
+
+    def _load(self, sid: str) -> Optional[dict]:
+        path = self._spill_path(sid)
+        try:
+            with open(path, "rb") as f:
+                # Raw CSV rows can carry a None key for surplus fields
+                entry = msgpack.unpackb(f.read(), ext_hook=_decode, raw=False, strict_map_key=False)
+        except FileNotFoundError:
+            return None
+        os.remove(path)
+        return entry
+
+    def _evict(self) -> List[Tuple[str, dict]]:
+        # Called with the lock held. Oldest first, skipping entries a request
+        # still holds: spilling those would leave the request writing to an
+        # orphaned copy. Victims are only marked here; _write_spills does the
+        # slow encoding once the lock is released.
+        victims: List[Tuple[str, dict]] = []
+        for old_sid in list(self._entries):
+            if len(self._entries) <= self.maxsize:
+                break
+            if self._in_use.get(old_sid):
+                continue
+            entry = self._entries.pop(old_sid)
+            self._spilling[old_sid] = entry
+            victims.append((old_sid, entry))
+        return victims
+
+    def _write_spills(self, victims: List[Tuple[str, dict]]) -> None:
+        for sid, entry in victims:
+            self._spill(sid, entry)
+            with self._cond:
+                del self._spilling[sid]
+                self._cond.notify_all()
+
+    def checkout(self, sid: str, default: dict) -> dict:
+        # Every checkout must be paired with release(sid) once the caller is done
+        with self._cond:
+            while True:
+                entry = self._entries.get(sid)
+                if entry is not None:
+                    self._entries.move_to_end(sid)
+                    break
+                if sid in self._spilling:
+                    # Read the file only once it has been written in full
+                    self._cond.wait()
+                    continue
+                entry = self._load(sid)
+                if entry is None:
+                    entry = default
+                self._entries[sid] = entry
+                break
+            self._in_use[sid] = self._in_use.get(sid, 0) + 1
+            victims = self._evict()
+        self._write_spills(victims)
+        return entry
+
+    def release(self, sid: str) -> None:
+        with self._cond:
+            count = self._in_use.get(sid, 0) - 1
+            if count > 0:
+                self._in_use[sid] = count
+            else:
+                self._in_use.pop(sid, None)
+            victims = self._evict()
+        self._write_spills(victims)
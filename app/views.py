@@ -1,14 +1,24 @@
 from __future__ import annotations
 
+import csv
 import io
 import os
+import tempfile
+import threading
+import time
 import uuid
+from collections import Counter
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from typing import Dict, List, Optional
 
+import numpy as np
 from flask import (
     Blueprint,
     Response,
     flash,
+    g,
+    jsonify,
     redirect,
     render_template,
     request,
@@ -17,12 +27,33 @@ from flask import (
     url_for,
 )
 
-from .utils.merge import read_table, normalize_records, infer_key_columns, combine_records
+from .utils.merge import read_and_normalize, infer_key_columns, combine_columns, column_rows
+from .utils.stats import float_stats
+from .utils.store import SessionStore
 
 main_bp = Blueprint("main", __name__)
 
-# Simple in-memory store keyed by session id
-IN_MEMORY_STORE: Dict[str, dict] = {}
+# In-memory store keyed by session id; least recently used sessions spill to disk
+IN_MEMORY_STORE = SessionStore(
+    os.path.join(os.environ.get("UPLOAD_FOLDER", "/workspace/app/uploads"), "session"),
+    maxsize=64,
+)
+
+# Uploads are parsed in worker processes: openpyxl parsing is CPU-bound Python
+EXECUTOR = ProcessPoolExecutor(max_workers=os.cpu_count())
+_EXECUTOR_LOCK = threading.Lock()
+
+# Upload jobs keyed by job id, in submission order. Futures cannot be spilled
+# with the session store, so they are held here until collected.
+UPLOAD_JOBS: Dict[str, dict] = {}
+_UPLOAD_JOBS_LOCK = threading.Lock()
+# Jobs not collected within this many seconds (e.g. the tab was closed) are dropped
+_UPLOAD_JOB_TTL = 60 * 60
+# Recently collected job ids remembered per session, so their status polls still resolve
+_COLLECTED_JOBS_KEPT = 16
+
+_XLSX_SPOOL_MAX_SIZE = 16 * 1024 * 1024  # 16 MB
+_CSV_CHUNK_ROWS = 1000
 
 
 def _get_session_id() -> str:
@@ -33,18 +64,178 @@ def _get_session_id() -> str:
     return sid
 
 
+# Thousands separators, currency symbols and (non-breaking) spaces in numbers
+_NUM_STRIP = str.maketrans("", "", ", $\u00a0")
+
+
+def _to_float(v) -> Optional[float]:
+    if v is None:
+        return None
+    try:
+        s = str(v).translate(_NUM_STRIP).strip()
+        return float(s) if s else None
+    except Exception:
+        return None
+
+
+# Fields the combine view guarantees and the dashboard table shows
+_DISPLAY_FIELDS = [
+    "organisation_id",
+    "customer",
+    "name",
+    "product_status",
+    "engagement_status",
+    "carbon_factor",
+    "next_activity_due_date",
+]
+
+
+def _float_column(values: list) -> np.ndarray:
+    # Unparseable or missing values become NaN so the nan* reductions skip them
+    floats = (_to_float(v) for v in values)
+    return np.fromiter(
+        (np.nan if x is None else x for x in floats), dtype=np.float64, count=len(values)
+    )
+
+
+def _compute_kpis(combined: Dict[str, list]) -> dict:
+    # Everything the dashboard shows, computed once per combine, straight from
+    # the column store
+    carbon_factor_stats = float_stats(_float_column(combined["carbon_factor"]))
+
+    # Sample table rows
+    sample = [combined[field][:200] for field in _DISPLAY_FIELDS]
+    sample_rows = [dict(zip(_DISPLAY_FIELDS, row)) for row in zip(*sample)]
+
+    return {
+        "total": column_rows(combined),
+        "engagement": Counter(str(v or "Unknown") for v in combined["engagement_status"]),
+        "product": Counter(str(v or "Unknown") for v in combined["product_status"]),
+        "cf_stats": carbon_factor_stats,
+        "due_soon": sum(combined["has_next_activity_due"]),
+        "sample_rows": sample_rows,
+    }
+
+
+def _iter_rows(combined: Dict[str, list], headers: List[str]):
+    # Rows for the exports, built one at a time from the columns
+    return zip(*(combined[h] for h in headers))
+
+
 def _get_store() -> Dict[str, dict]:
-    sid = _get_session_id()
-    store = IN_MEMORY_STORE.setdefault(sid, {"frames": [], "combined": None, "meta": []})
-    return store
+    # Checked out once per request and released in _release_store, so the
+    # entry cannot be spilled while this request is still changing it
+    if "store" not in g:
+        sid = _get_session_id()
+        g.store = IN_MEMORY_STORE.checkout(sid, {"frames": [], "combined": None, "meta": []})
+        g.store_sid = sid
+    return g.store
+
+
+@main_bp.teardown_request
+def _release_store(exc: Optional[BaseException]) -> None:
+    sid = g.pop("store_sid", None)
+    g.pop("store", None)
+    if sid is not None:
+        IN_MEMORY_STORE.release(sid)
+
+
+def _submit_upload(data: bytes, filename: str) -> Future:
+    # A worker that dies (e.g. OOM-killed on a huge workbook) breaks the whole
+    # pool, so it is replaced once; if the new pool is broken too the file is
+    # parsed on the request thread
+    global EXECUTOR
+    executor = EXECUTOR
+    try:
+        return executor.submit(read_and_normalize, data, filename)
+    except BrokenProcessPool:
+        pass
+    with _EXECUTOR_LOCK:
+        if EXECUTOR is executor:
+            executor.shutdown(wait=False, cancel_futures=True)
+            EXECUTOR = ProcessPoolExecutor(max_workers=os.cpu_count())
+        executor = EXECUTOR
+    try:
+        return executor.submit(read_and_normalize, data, filename)
+    except BrokenProcessPool:
+        pass
+    fut: Future = Future()
+    try:
+        fut.set_result(read_and_normalize(data, filename))
+    except Exception as e:
+        fut.set_exception(e)
+    return fut
+
+
+def _purge_stale_uploads() -> None:
+    # UPLOAD_JOBS is outside the bounded session store, so abandoned jobs would
+    # otherwise keep their parsed frames in memory for the life of the process
+    cutoff = time.monotonic() - _UPLOAD_JOB_TTL
+    with _UPLOAD_JOBS_LOCK:
+        for job_id, job in list(UPLOAD_JOBS.items()):
+            if job["created"] >= cutoff:
+                break
+            del UPLOAD_JOBS[job_id]
+            for _, fut in job["files"]:
+                fut.cancel()
+
+
+def _pending_uploads(sid: str) -> int:
+    with _UPLOAD_JOBS_LOCK:
+        return sum(1 for job in UPLOAD_JOBS.values() if job["sid"] == sid)
+
+
+def _collect_uploads(sid: str, store: dict) -> None:
+    # Move parsed frames into the store oldest job first, stopping at the first
+    # unfinished one, so frames keep upload order
+    with _UPLOAD_JOBS_LOCK:
+        for job_id, job in list(UPLOAD_JOBS.items()):
+            if job["sid"] != sid:
+                continue
+            if not all(fut.done() for _, fut in job["files"]):
+                break
+            del UPLOAD_JOBS[job_id]
+            collected = store.setdefault("collected_jobs", [])
+            collected.append(job_id)
+            del collected[:-_COLLECTED_JOBS_KEPT]
+            for original_name, fut in job["files"]:
+                try:
+                    normalized, col_map = fut.result()
+                except BrokenProcessPool:
+                    flash(f"Failed to read {original_name}: the worker parsing it stopped unexpectedly.", "danger")
+                    continue
+                except Exception as e:
+                    flash(f"Failed to read {original_name}: {e}", "danger")
+                    continue
+
+                store["frames"].append(normalized)
+                # A new frame makes any previous combine stale
+                store["combined"] = None
+                store.pop("kpis", None)
+                # Every raw header is in col_map, so its values are the frame's columns
+                all_cols = sorted(set(col_map.values()))
+                store["meta"].append({
+                    "original_name": original_name,
+                    "columns": all_cols,
+                    "col_map": col_map,
+                })
+            session.modified = True
+            flash("Files uploaded successfully.", "success")
 
 
 @main_bp.route("/")
 def index():
     store = _get_store()
+    sid = _get_session_id()
+    _collect_uploads(sid, store)
     frames_meta = store.get("meta", [])
     has_combined = store.get("combined") is not None
-    return render_template("index.html", frames_meta=frames_meta, has_combined=has_combined)
+    return render_template(
+        "index.html",
+        frames_meta=frames_meta,
+        has_combined=has_combined,
+        pending_uploads=_pending_uploads(sid),
+    )
 
 
 @main_bp.route("/upload", methods=["POST"])
@@ -54,42 +245,67 @@ def upload():
         flash("Please select at least one Excel file.", "warning")
         return redirect(url_for("main.index"))
 
-    store = _get_store()
-
+    _purge_stale_uploads()
+    submitted = []
     for f in files:
         if not f.filename:
             continue
-        original_name = f.filename
-        filename = uuid.uuid4().hex + os.path.splitext(original_name)[1]
-        path = os.path.join(os.environ.get("UPLOAD_FOLDER", "/workspace/app/uploads"), filename)
-        os.makedirs(os.path.dirname(path), exist_ok=True)
-        f.save(path)
-
-        # Read and normalize
-        try:
-            records = read_table(path)
-        except Exception as e:
-            flash(f"Failed to read {original_name}: {e}", "danger")
-            continue
+        # Workers get the raw bytes: the upload stream cannot cross processes,
+        # and the file is still never written to UPLOAD_FOLDER
+        submitted.append((f.filename, _submit_upload(f.read(), f.filename)))
 
-        normalized, col_map = normalize_records(records)
-        store["frames"].append(normalized)
-        all_cols = sorted({c for r in normalized for c in r.keys()})
-        store["meta"].append({
-            "original_name": original_name,
-            "stored_as": filename,
-            "columns": all_cols,
-            "col_map": col_map,
-        })
+    if not submitted:
+        flash("Please select at least one Excel file.", "warning")
+        return redirect(url_for("main.index"))
 
+    job_id = uuid.uuid4().hex
+    with _UPLOAD_JOBS_LOCK:
+        UPLOAD_JOBS[job_id] = {
+            "sid": _get_session_id(),
+            "files": submitted,
+            "created": time.monotonic(),
+        }
     session.modified = True
-    flash("Files uploaded successfully.", "success")
-    return redirect(url_for("main.index"))
+    return render_template("upload_status.html", job_id=job_id, total=len(submitted)), 202
+
+
+@main_bp.route("/upload/status/<job_id>")
+def upload_status(job_id: str):
+    store = _get_store()
+    sid = _get_session_id()
+    with _UPLOAD_JOBS_LOCK:
+        job = UPLOAD_JOBS.get(job_id)
+        if job is not None and job["sid"] == sid:
+            done = sum(1 for _, fut in job["files"] if fut.done())
+            total = len(job["files"])
+        else:
+            job = None
+    if job is None:
+        if job_id in store.get("collected_jobs", ()):
+            # Already collected into this session's store
+            return jsonify({"finished": True, "redirect": url_for("main.index")})
+        # Never issued, purged, another session's or held by another worker
+        return jsonify({"error": "Unknown upload."}), 404
+    if done == total:
+        # Move the frames into the session store now, so they are bounded by
+        # its LRU even if the user never loads another page
+        _collect_uploads(sid, store)
+    return jsonify({
+        "done": done,
+        "total": total,
+        "finished": done == total,
+        "redirect": url_for("main.index"),
+    })
 
 
 @main_bp.route("/combine", methods=["POST"])
 def combine():
     store = _get_store()
+    sid = _get_session_id()
+    _collect_uploads(sid, store)
+    if _pending_uploads(sid):
+        flash("Uploads are still being processed; try again shortly.", "warning")
+        return redirect(url_for("main.index"))
     frames: List[list[dict]] = store.get("frames", [])
     if not frames:
         flash("Upload files before combining.", "warning")
@@ -102,34 +318,30 @@ def combine():
         ["customer", "name"],
     ]
 
-    keys = infer_key_columns(frames, key_options)
+    # Column lists were recorded per frame at upload time
+    frame_columns = [m["columns"] for m in store.get("meta", [])]
+    keys = infer_key_columns(frames, key_options, frame_columns)
     if not keys:
         flash("Could not infer matching keys from uploaded files.", "danger")
         return redirect(url_for("main.index"))
 
-    combined_records = combine_records(frames, keys)
+    # Kept as columns: the dashboard and exports never need a dict per row
+    combined = combine_columns(frames, keys)
+    n = column_rows(combined)
 
-    # Select/ensure display fields
     # Ensure display fields exist
-    display_fields = [
-        "organisation_id",
-        "customer",
-        "name",
-        "product_status",
-        "engagement_status",
-        "carbon_factor",
-        "next_activity_due_date",
-    ]
-    for rec in combined_records:
-        for field in display_fields:
-            rec.setdefault(field, None)
+    for field in _DISPLAY_FIELDS:
+        if field not in combined:
+            combined[field] = [None] * n
 
-    # Compute derived fields for dashboard
-    for rec in combined_records:
-        nad = rec.get("next_activity_due_date")
-        rec["has_next_activity_due"] = bool(nad not in (None, ""))
+    # Compute derived fields for dashboard; blank cells are already None
+    combined["has_next_activity_due"] = [
+        nad is not None for nad in combined["next_activity_due_date"]
+    ]
 
-    store["combined"] = combined_records
+    store["combined"] = combined
+    store["headers"] = sorted(combined)
+    store["kpis"] = _compute_kpis(combined)
     session.modified = True
     flash(f"Combined {len(frames)} files on keys: {', '.join(keys)}.", "success")
     return redirect(url_for("main.dashboard"))
@@ -138,84 +350,50 @@ def combine():
 @main_bp.route("/dashboard")
 def dashboard():
     store = _get_store()
-    combined: Optional[list[dict]] = store.get("combined")
-    if not combined:
+    combined: Optional[Dict[str, list]] = store.get("combined")
+    if not combined or not column_rows(combined):
         flash("No combined data available. Upload and combine files.", "info")
         return redirect(url_for("main.index"))
 
-    # KPIs
-    total_contractors = len(combined)
-    def _vc(records: list[dict], field: str) -> dict:
-        counts: Dict[str, int] = {}
-        for r in records:
-            key = str(r.get(field) or "Unknown")
-            counts[key] = counts.get(key, 0) + 1
-        return counts
-
-    engagement_breakdown = _vc(combined, "engagement_status")
-    product_breakdown = _vc(combined, "product_status")
-
-    def _to_float(v) -> Optional[float]:
-        try:
-            if v is None or str(v).strip() == "":
-                return None
-            return float(str(v).replace(",", ""))
-        except Exception:
-            return None
-
-    cf_values = [x for x in (_to_float(r.get("carbon_factor")) for r in combined) if x is not None]
-    carbon_factor_stats = {
-        "avg": float(sum(cf_values) / len(cf_values)) if cf_values else 0.0,
-        "min": float(min(cf_values)) if cf_values else 0.0,
-        "max": float(max(cf_values)) if cf_values else 0.0,
-    }
-
-    due_soon_count = sum(1 for r in combined if r.get("has_next_activity_due"))
-
-    # Sample table rows
-    sample_rows = [
-        {
-            "organisation_id": r.get("organisation_id"),
-            "customer": r.get("customer"),
-            "name": r.get("name"),
-            "product_status": r.get("product_status"),
-            "engagement_status": r.get("engagement_status"),
-            "carbon_factor": r.get("carbon_factor"),
-            "next_activity_due_date": r.get("next_activity_due_date"),
-        }
-        for r in combined[:200]
-    ]
+    kpis = store.get("kpis")
+    if kpis is None:
+        kpis = store["kpis"] = _compute_kpis(combined)
 
     return render_template(
         "dashboard.html",
-        total_contractors=total_contractors,
-        engagement_breakdown=engagement_breakdown,
-        product_breakdown=product_breakdown,
-        carbon_factor_stats=carbon_factor_stats,
-        due_soon_count=due_soon_count,
-        table=sample_rows,
+        total_contractors=kpis["total"],
+        engagement_breakdown=kpis["engagement"],
+        product_breakdown=kpis["product"],
+        carbon_factor_stats=kpis["cf_stats"],
+        due_soon_count=kpis["due_soon"],
+        table=kpis["sample_rows"],
     )
 
 
 @main_bp.route("/export/csv")
 def export_csv():
     store = _get_store()
-    combined: Optional[list[dict]] = store.get("combined")
-    if not combined:
+    combined: Optional[Dict[str, list]] = store.get("combined")
+    if not combined or not column_rows(combined):
         flash("No combined data to export.", "warning")
         return redirect(url_for("main.index"))
 
-    output = io.StringIO()
-    # Build CSV headers from union of keys
-    headers = sorted({k for r in combined for k in r.keys()})
-    import csv as _csv
-    writer = _csv.DictWriter(output, fieldnames=headers)
-    writer.writeheader()
-    for row in combined:
-        writer.writerow({k: row.get(k) for k in headers})
-    output.seek(0)
+    headers = store["headers"]
+
+    def generate():
+        buf = io.StringIO()
+        writer = csv.writer(buf)
+        writer.writerow(headers)
+        for i, row in enumerate(_iter_rows(combined, headers), 1):
+            writer.writerow(row)
+            if i % _CSV_CHUNK_ROWS == 0:
+                yield buf.getvalue()
+                buf.seek(0)
+                buf.truncate()
+        yield buf.getvalue()
+
     return Response(
-        output.getvalue(),
+        generate(),
         mimetype="text/csv",
         headers={"Content-Disposition": "attachment; filename=combined.csv"},
     )
@@ -224,22 +402,25 @@ def export_csv():
 @main_bp.route("/export/xlsx")
 def export_xlsx():
     store = _get_store()
-    combined: Optional[list[dict]] = store.get("combined")
-    if not combined:
+    combined: Optional[Dict[str, list]] = store.get("combined")
+    if not combined or not column_rows(combined):
         flash("No combined data to export.", "warning")
         return redirect(url_for("main.index"))
 
-    output = io.BytesIO()
+    # Small workbooks stay in memory, large ones roll over to a temp file
+    output = tempfile.SpooledTemporaryFile(max_size=_XLSX_SPOOL_MAX_SIZE)
     try:
         from openpyxl import Workbook
-        wb = Workbook()
-        ws = wb.active
-        headers = sorted({k for r in combined for k in r.keys()})
+        # write_only streams rows to the sheet XML instead of keeping every cell
+        wb = Workbook(write_only=True)
+        ws = wb.create_sheet()
+        headers = store["headers"]
         ws.append(headers)
-        for row in combined:
-            ws.append([row.get(h) for h in headers])
+        for row in _iter_rows(combined, headers):
+            ws.append(list(row))
         wb.save(output)
     except Exception as e:
+        output.close()
         return Response(f"Failed to export XLSX: {e}", status=500)
     output.seek(0)
     return send_file(